@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+"""
+Gunicorn configuration for the Charge Request Service
+Active sessions are tracked in process memory, so the service runs as a
+single worker and scales request handling with threads
+"""
+
+import os
+
+bind = '0.0.0.0:5002'
+workers = 1
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
@@ -5,12 +5,17 @@ Public entry point for EV charging requests
 """
 
 import time
+import atexit
 import requests
 import threading
-from flask import Flask, jsonify, request
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import Flask, request
 from prometheus_client import generate_latest, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST
 import logging
-import json
+import orjson
 import os
 
 # Configure logging
@@ -19,48 +24,74 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+def jsonify(obj):
+    """Serialize a response body with orjson instead of the stdlib encoder"""
+    return app.response_class(orjson.dumps(obj), mimetype='application/json')
+
 # Prometheus metrics
 requests_total = Counter('charge_requests_total', 'Total charging requests received')
 requests_duration = Histogram('charge_requests_duration_seconds', 'Time to process charging requests')
 active_sessions = Gauge('active_sessions', 'Number of active charging sessions')
 failed_requests = Counter('failed_requests_total', 'Total failed requests')
 
+MAX_BATCH_SIZE = 256
+
 class ChargeRequestService:
     def __init__(self):
         self.load_balancer_url = os.getenv('LOAD_BALANCER_URL', 'http://load_balancer:5001')
-        self.active_sessions = {}
+        # Abandoned sessions (missed stops, crashed EVs) expire instead of
+        # accumulating; TTLCache is not thread-safe, so every access is
+        # a short critical section under self.lock
+        self.active_sessions = TTLCache(maxsize=200_000, ttl=4 * 3600)
         self.lock = threading.Lock()
+        active_sessions.set_function(self.count_active_sessions)
+        
+        # Reuse pooled keep-alive connections to the load balancer and substations
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=128,
+            max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount('http://', adapter)
+        atexit.register(self.session.close)
+        
+        # Fans batched requests out to the load balancer over the pooled session
+        self.batch_pool = ThreadPoolExecutor(max_workers=32)
         
     def submit_charging_request(self, ev_id, requested_kw, duration_minutes=None):
         """Submit a charging request to the load balancer"""
         try:
             start_time = time.time()
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.load_balancer_url}/charge",
-                json={
+                data=orjson.dumps({
                     'ev_id': ev_id,
                     'requested_kw': requested_kw
-                },
-                timeout=30
+                }),
+                headers=JSON_HEADERS,
+                timeout=(3.05, 30)
             )
             
             requests_duration.observe(time.time() - start_time)
             
             if response.status_code == 200:
-                result = response.json()
+                result = orjson.loads(response.content)
                 session_id = result.get('session_id')
                 
                 if session_id:
+                    session = {
+                        'ev_id': ev_id,
+                        'requested_kw': requested_kw,
+                        'substation_id': result.get('substation_id'),
+                        'start_time': time.time(),
+                        'duration_minutes': duration_minutes
+                    }
                     with self.lock:
-                        self.active_sessions[session_id] = {
-                            'ev_id': ev_id,
-                            'requested_kw': requested_kw,
-                            'substation_id': result.get('substation_id'),
-                            'start_time': time.time(),
-                            'duration_minutes': duration_minutes
-                        }
-                        active_sessions.set(len(self.active_sessions))
+                        self.active_sessions[session_id] = session
                     
                     logger.info(f"Started charging session {session_id} for EV {ev_id}")
                     return result
@@ -80,25 +111,24 @@ class ChargeRequestService:
         """Stop a charging session"""
         try:
             with self.lock:
-                if session_id not in self.active_sessions:
-                    return {'error': 'Session not found'}
-                
-                session = self.active_sessions[session_id]
-                substation_id = session['substation_id']
+                session = self.active_sessions.get(session_id)
+            if session is None:
+                return {'error': 'Session not found'}
+            
+            substation_id = session['substation_id']
             
             # Find the substation URL and stop the session
             # This is a simplified approach - in a real system, you'd track substation URLs
             substation_url = f"http://substation_{substation_id}:5000"
             
-            response = requests.delete(
+            response = self.session.delete(
                 f"{substation_url}/charge/{session_id}",
-                timeout=10
+                timeout=(3.05, 10)
             )
             
             if response.status_code == 200:
                 with self.lock:
-                    del self.active_sessions[session_id]
-                    active_sessions.set(len(self.active_sessions))
+                    self.active_sessions.pop(session_id, None)
                 
                 logger.info(f"Stopped charging session {session_id}")
                 return {'status': 'stopped', 'session_id': session_id}
@@ -109,17 +139,37 @@ class ChargeRequestService:
             logger.error(f"Error stopping charging session: {e}")
             return {'error': str(e)}
     
+    def submit_charging_batch(self, batch):
+        """Submit several charging requests concurrently, preserving their order"""
+        return list(self.batch_pool.map(self._submit_batch_item, batch))
+    
+    def _submit_batch_item(self, item):
+        """Validate and submit one entry of a charging batch"""
+        ev_id = item.get('ev_id') if isinstance(item, dict) else None
+        if not ev_id:
+            failed_requests.inc()
+            return {'error': 'ev_id is required'}
+        
+        return self.submit_charging_request(ev_id, item.get('requested_kw', 10), item.get('duration_minutes'))
+    
     def get_active_sessions(self):
         """Get all active charging sessions"""
         with self.lock:
-            return self.active_sessions.copy()
+            self.active_sessions.expire()
+            return dict(self.active_sessions)
+    
+    def count_active_sessions(self):
+        """Number of unexpired charging sessions"""
+        with self.lock:
+            self.active_sessions.expire()
+            return len(self.active_sessions)
     
     def get_status(self):
         """Get service status"""
         return {
             'service': 'charge_request_service',
             'load_balancer_url': self.load_balancer_url,
-            'active_sessions': len(self.active_sessions),
+            'active_sessions': self.count_active_sessions(),
             'timestamp': time.time()
         }
 
@@ -144,7 +194,7 @@ def get_status():
 def submit_charging_request():
     """Submit a charging request"""
     try:
-        data = request.get_json()
+        data = orjson.loads(request.get_data())
         ev_id = data.get('ev_id')
         requested_kw = data.get('requested_kw', 10)
         duration_minutes = data.get('duration_minutes')
@@ -165,6 +215,25 @@ def submit_charging_request():
         logger.error(f"Error processing charging request: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/charge/batch', methods=['POST'])
+def submit_charging_batch():
+    """Submit a batch of charging requests; results mirror the request order"""
+    try:
+        data = orjson.loads(request.get_data())
+        
+        if not isinstance(data, list) or not data:
+            return jsonify({'error': 'a non-empty list of charging requests is required'}), 400
+        if len(data) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'batch size is limited to {MAX_BATCH_SIZE}'}), 400
+        
+        requests_total.inc(len(data))
+        
+        return jsonify(charge_service.submit_charging_batch(data))
+            
+    except Exception as e:
+        logger.error(f"Error processing charging batch: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/sessions', methods=['GET'])
 def get_sessions():
     """Get all active charging sessions"""
@@ -200,6 +269,7 @@ def root():
             'health': '/health',
             'status': '/status',
             'charge': '/charge (POST)',
+            'charge_batch': '/charge/batch (POST)',
             'sessions': '/sessions (GET)',
             'stop_session': '/sessions/<session_id> (DELETE)',
             'metrics': '/metrics'
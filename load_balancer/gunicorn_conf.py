@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Gunicorn configuration for the Load Balancer
+Registered substations and polled metrics live in process memory, so the
+service runs as a single worker and scales request handling with threads
+"""
+
+import os
+
+bind = '0.0.0.0:5001'
+workers = 1
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+
+def post_worker_init(worker):
+    """Start substation polling inside the serving worker"""
+    from main import load_balancer
+    load_balancer.start_polling()
+
+def worker_exit(server, worker):
+    """Stop substation polling when the worker shuts down"""
+    from main import load_balancer
+    load_balancer.stop_polling()
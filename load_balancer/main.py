@@ -7,10 +7,13 @@ Routes charging requests to the least loaded substation based on real-time metri
 import time
 import requests
 import threading
-from flask import Flask, jsonify, request
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from flask import Flask, request
 from prometheus_client import generate_latest, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST
 import logging
-import json
+import orjson
+from urllib.parse import urlparse
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +21,12 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+def jsonify(obj):
+    """Serialize a response body with orjson instead of the stdlib encoder"""
+    return app.response_class(orjson.dumps(obj), mimetype='application/json')
+
 # Prometheus metrics
 requests_total = Counter('load_balancer_requests_total', 'Total requests processed')
 routing_decisions = Counter('routing_decisions_total', 'Routing decisions made', ['substation_id'])
@@ -25,19 +34,37 @@ substation_load = Gauge('substation_load_percentage', 'Current load percentage',
 polling_duration = Histogram('polling_duration_seconds', 'Time to poll substation metrics')
 
 class LoadBalancer:
-    def __init__(self):
-        self.substations = []
+    def __init__(self, substation_hint=8):
+        self.substations = {}  # url -> {'id', 'gauge', 'counter'}
         self.substation_metrics = {}
+        self._least_loaded = None
         self.lock = threading.Lock()
         self.polling_interval = 5  # seconds
         self.polling_thread = None
+        self.poll_workers = 32
+        self.pool = None
         self.running = False
         
+        # One keep-alive pool per substation host, shared by the poller and the router
+        self.session = requests.Session()
+        self.session.headers['Connection'] = 'keep-alive'
+        adapter = HTTPAdapter(
+            pool_connections=substation_hint,
+            pool_maxsize=max(32, 4 * substation_hint)
+        )
+        self.session.mount('http://', adapter)
+        
     def add_substation(self, substation_url):
         """Add a substation to the load balancer"""
         with self.lock:
             if substation_url not in self.substations:
-                self.substations.append(substation_url)
+                # Resolve the label id and bind the labelled metric children once
+                substation_id = urlparse(substation_url).hostname or substation_url.rsplit('/', 1)[-1]
+                self.substations[substation_url] = {
+                    'id': substation_id,
+                    'gauge': substation_load.labels(substation_id=substation_id),
+                    'counter': routing_decisions.labels(substation_id=substation_id)
+                }
                 logger.info(f"Added substation: {substation_url}")
                 return True
             return False
@@ -46,76 +73,90 @@ class LoadBalancer:
         """Remove a substation from the load balancer"""
         with self.lock:
             if substation_url in self.substations:
-                self.substations.remove(substation_url)
+                del self.substations[substation_url]
                 if substation_url in self.substation_metrics:
-                    del self.substation_metrics[substation_url]
+                    new_metrics = self.substation_metrics.copy()
+                    del new_metrics[substation_url]
+                    self._publish_metrics(new_metrics)
                 logger.info(f"Removed substation: {substation_url}")
                 return True
             return False
     
     def poll_substation_metrics(self, substation_url):
-        """Poll metrics from a single substation"""
+        """Poll metrics from a single substation, returning its metrics entry or None"""
         try:
             start_time = time.time()
-            response = requests.get(f"{substation_url}/metrics", timeout=5)
+            response = self.session.get(f"{substation_url}/load", timeout=(3.05, 5))
             polling_duration.observe(time.time() - start_time)
             
             if response.status_code == 200:
-                # Parse Prometheus metrics to extract current_load and total_capacity
-                metrics_text = response.text
-                current_load = 0
-                total_capacity = 1
-                
-                for line in metrics_text.split('\n'):
-                    if line.startswith('current_load '):
-                        current_load = float(line.split(' ')[1])
-                    elif line.startswith('total_capacity '):
-                        total_capacity = float(line.split(' ')[1])
+                # Compact JSON load reading instead of the full Prometheus exposition
+                data = orjson.loads(response.content)
+                current_load = data['current_load']
+                total_capacity = data['total_capacity']
                 
                 load_percentage = (current_load / total_capacity) * 100 if total_capacity > 0 else 0
                 
-                with self.lock:
-                    self.substation_metrics[substation_url] = {
-                        'current_load': current_load,
-                        'total_capacity': total_capacity,
-                        'load_percentage': load_percentage,
-                        'last_updated': time.time()
-                    }
-                    
-                    # Update Prometheus metrics
-                    substation_id = substation_url.split('/')[-1] if substation_url.endswith('/') else substation_url.split('/')[-1]
-                    substation_load.labels(substation_id=substation_id).set(load_percentage)
+                # Update Prometheus metrics
+                entry = self.substations.get(substation_url)
+                if entry:
+                    entry['gauge'].set(load_percentage)
                 
                 logger.debug(f"Updated metrics for {substation_url}: {load_percentage:.2f}% load")
-                return True
+                return {
+                    'current_load': current_load,
+                    'total_capacity': total_capacity,
+                    'load_percentage': load_percentage,
+                    'last_updated': time.time()
+                }
             else:
                 logger.warning(f"Failed to poll {substation_url}: HTTP {response.status_code}")
-                return False
+                return None
                 
         except Exception as e:
             logger.error(f"Error polling {substation_url}: {e}")
-            return False
+            return None
     
     def poll_all_substations(self):
         """Poll metrics from all substations"""
         while self.running:
             with self.lock:
-                substations_to_poll = self.substations.copy()
+                substations_to_poll = list(self.substations)
+            
+            # Poll every substation concurrently so a cycle costs ~one RTT, not N
+            results = self.pool.map(self.poll_substation_metrics, substations_to_poll)
+            
+            # Build the next metrics table off-lock; substations that failed this
+            # cycle keep their last known metrics
+            previous = self.substation_metrics
+            new_metrics = {}
+            for substation_url, metrics in zip(substations_to_poll, results):
+                if metrics is None:
+                    metrics = previous.get(substation_url)
+                if metrics is not None:
+                    new_metrics[substation_url] = metrics
             
-            for substation_url in substations_to_poll:
-                self.poll_substation_metrics(substation_url)
+            with self.lock:
+                # Drop anything removed while this cycle was in flight
+                for substation_url in list(new_metrics):
+                    if substation_url not in self.substations:
+                        del new_metrics[substation_url]
+                self._publish_metrics(new_metrics)
             
             time.sleep(self.polling_interval)
     
+    def _publish_metrics(self, new_metrics):
+        """Swap in a new metrics table and its routing target (caller holds self.lock)"""
+        least_loaded = None
+        if new_metrics:
+            least_loaded = min(new_metrics, key=lambda url: new_metrics[url]['load_percentage'])
+        # Published dicts are never mutated, so readers can use them without the lock
+        self.substation_metrics = new_metrics
+        self._least_loaded = least_loaded
+    
     def get_least_loaded_substation(self):
         """Get the substation with the lowest load percentage"""
-        with self.lock:
-            if not self.substation_metrics:
-                return None
-            
-            least_loaded = min(self.substation_metrics.items(), 
-                             key=lambda x: x[1]['load_percentage'])
-            return least_loaded[0]
+        return self._least_loaded
     
     def route_charging_request(self, ev_id, requested_kw):
         """Route a charging request to the least loaded substation"""
@@ -125,16 +166,18 @@ class LoadBalancer:
             return None, "No available substations"
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{substation_url}/charge",
-                json={'ev_id': ev_id, 'requested_kw': requested_kw},
-                timeout=10
+                data=orjson.dumps({'ev_id': ev_id, 'requested_kw': requested_kw}),
+                headers=JSON_HEADERS,
+                timeout=(3.05, 10)
             )
             
             if response.status_code == 200:
-                result = response.json()
-                substation_id = substation_url.split('/')[-1] if substation_url.endswith('/') else substation_url.split('/')[-1]
-                routing_decisions.labels(substation_id=substation_id).inc()
+                result = orjson.loads(response.content)
+                entry = self.substations.get(substation_url)
+                if entry:
+                    entry['counter'].inc()
                 return result, None
             else:
                 return None, f"Substation error: {response.status_code}"
@@ -147,6 +190,7 @@ class LoadBalancer:
         """Start the polling thread"""
         if not self.running:
             self.running = True
+            self.pool = ThreadPoolExecutor(max_workers=self.poll_workers)
             self.polling_thread = threading.Thread(target=self.poll_all_substations, daemon=True)
             self.polling_thread.start()
             logger.info("Started substation polling")
@@ -157,17 +201,20 @@ class LoadBalancer:
         if self.polling_thread:
             self.polling_thread.join()
             logger.info("Stopped substation polling")
+        if self.pool:
+            self.pool.shutdown(wait=False)
+            self.pool = None
     
     def get_status(self):
         """Get load balancer status"""
-        with self.lock:
-            return {
-                'substations': len(self.substations),
-                'active_substations': len(self.substation_metrics),
-                'substation_metrics': self.substation_metrics.copy(),
-                'polling_interval': self.polling_interval,
-                'running': self.running
-            }
+        metrics = self.substation_metrics
+        return {
+            'substations': len(self.substations),
+            'active_substations': len(metrics),
+            'substation_metrics': metrics,
+            'polling_interval': self.polling_interval,
+            'running': self.running
+        }
 
 # Initialize load balancer
 load_balancer = LoadBalancer()
@@ -189,17 +236,16 @@ def get_status():
 @app.route('/substations', methods=['GET'])
 def list_substations():
     """List all registered substations"""
-    with load_balancer.lock:
-        return jsonify({
-            'substations': load_balancer.substations,
-            'metrics': load_balancer.substation_metrics
-        })
+    return jsonify({
+        'substations': list(load_balancer.substations),
+        'metrics': load_balancer.substation_metrics
+    })
 
 @app.route('/substations', methods=['POST'])
 def add_substation():
     """Add a substation to the load balancer"""
     try:
-        data = request.get_json()
+        data = orjson.loads(request.get_data())
         substation_url = data.get('substation_url')
         
         if not substation_url:
@@ -235,7 +281,7 @@ def remove_substation(substation_url):
 def route_charging_request():
     """Route a charging request to the least loaded substation"""
     try:
-        data = request.get_json()
+        data = orjson.loads(request.get_data())
         ev_id = data.get('ev_id')
         requested_kw = data.get('requested_kw', 10)
         
@@ -6,15 +6,20 @@ Simulates rush hour EV charging requests to test system performance
 
 import time
 import requests
-import threading
-import random
+from requests.adapters import HTTPAdapter
+import numpy as np
 import json
-import statistics
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 import argparse
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -22,29 +27,35 @@ logger = logging.getLogger(__name__)
 class LoadTester:
     def __init__(self, base_url="http://localhost:5002"):
         self.base_url = base_url
-        self.results = []
-        self.lock = threading.Lock()
-        self.session_ids = []
-        
-    def generate_ev_request(self):
-        """Generate a realistic EV charging request"""
-        ev_id = f"EV_{random.randint(1000, 9999)}"
-        requested_kw = random.choice([7, 11, 22, 50])  # Common EV charging rates
-        duration_minutes = random.randint(30, 240)  # 30 minutes to 4 hours
-        
-        return {
-            'ev_id': ev_id,
-            'requested_kw': requested_kw,
-            'duration_minutes': duration_minutes
-        }
+        # deque.append is atomic, so worker threads record results without a lock
+        self.results = deque()
+        self.session_ids = deque()
+        self.session = requests.Session()
+        self.ev_requests = []
+        
+    def generate_ev_requests(self, count):
+        """Pre-generate realistic EV charging requests for a test run"""
+        rng = np.random.default_rng()
+        ev_ids = rng.integers(1000, 10000, count).tolist()
+        requested_kws = rng.choice([7, 11, 22, 50], count).tolist()  # Common EV charging rates
+        durations = rng.integers(30, 241, count).tolist()  # 30 minutes to 4 hours
+        
+        return [
+            {
+                'ev_id': f"EV_{ev_id}",
+                'requested_kw': requested_kw,
+                'duration_minutes': duration_minutes
+            }
+            for ev_id, requested_kw, duration_minutes in zip(ev_ids, requested_kws, durations)
+        ]
     
     def submit_charging_request(self, request_id):
         """Submit a single charging request"""
         try:
-            request_data = self.generate_ev_request()
+            request_data = self.ev_requests[request_id - 1]
             start_time = time.time()
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/charge",
                 json=request_data,
                 timeout=30
@@ -69,15 +80,13 @@ class LoadTester:
                 result['session_id'] = response_data.get('session_id')
                 result['substation_id'] = response_data.get('substation_id')
                 
-                with self.lock:
-                    self.session_ids.append(result['session_id'])
+                self.session_ids.append(result['session_id'])
                 
                 logger.info(f"Request {request_id}: EV {request_data['ev_id']} assigned to substation {result['substation_id']}")
             else:
                 logger.warning(f"Request {request_id}: Failed with status {response.status_code}")
             
-            with self.lock:
-                self.results.append(result)
+            self.results.append(result)
             
             return result
             
@@ -95,33 +104,112 @@ class LoadTester:
                 'timestamp': time.time()
             }
             
-            with self.lock:
-                self.results.append(result)
+            self.results.append(result)
             
             return result
     
-    def run_load_test(self, num_requests, concurrent_users, ramp_up_seconds=60):
+    def submit_charging_batch(self, request_ids):
+        """Submit several charging requests in a single POST to /charge/batch"""
+        batch = [self.ev_requests[request_id - 1] for request_id in request_ids]
+        start_time = time.time()
+        error = None
+        
+        try:
+            response = self.session.post(
+                f"{self.base_url}/charge/batch",
+                json=batch,
+                timeout=60
+            )
+            status_code = response.status_code
+            responses = response.json() if status_code == 200 else [{}] * len(batch)
+        except Exception as e:
+            logger.error(f"Batch {request_ids[0]}-{request_ids[-1]}: Error - {e}")
+            status_code = 0
+            responses = [{}] * len(batch)
+            error = str(e)
+        
+        duration = time.time() - start_time
+        results = []
+        
+        for request_id, request_data, response_data in zip(request_ids, batch, responses):
+            success = status_code == 200 and 'error' not in response_data
+            # Per-item failures inside a 200 batch mirror /charge's 503
+            item_status = status_code if status_code != 200 else (200 if success else 503)
+            result = {
+                'request_id': request_id,
+                'ev_id': request_data['ev_id'],
+                'requested_kw': request_data['requested_kw'],
+                'duration_minutes': request_data['duration_minutes'],
+                'response_time': duration,
+                'status_code': item_status,
+                'success': success,
+                'timestamp': start_time
+            }
+            
+            if success:
+                result['session_id'] = response_data.get('session_id')
+                result['substation_id'] = response_data.get('substation_id')
+                self.session_ids.append(result['session_id'])
+            elif error:
+                result['error'] = error
+            elif 'error' in response_data:
+                result['error'] = response_data['error']
+            
+            self.results.append(result)
+            results.append(result)
+        
+        logger.info(f"Batch {request_ids[0]}-{request_ids[-1]}: {sum(r['success'] for r in results)}/{len(results)} assigned")
+        return results
+    
+    def run_load_test(self, num_requests, concurrent_users, ramp_up_seconds=60, batch_size=1):
         """Run the load test with specified parameters"""
         logger.info(f"Starting load test: {num_requests} requests, {concurrent_users} concurrent users")
         logger.info(f"Ramp-up time: {ramp_up_seconds} seconds")
+        if batch_size > 1:
+            logger.info(f"Batch size: {batch_size} requests per POST")
         
+        self.ev_requests = self.generate_ev_requests(num_requests)
         start_time = time.time()
         
+        # Group request ids into the units of work sent per POST
+        request_ids = list(range(1, num_requests + 1))
+        if batch_size > 1:
+            work = [request_ids[i:i + batch_size] for i in range(0, num_requests, batch_size)]
+            submit_request = self.submit_charging_batch
+        else:
+            work = request_ids
+            submit_request = self.submit_charging_request
+        
         # Calculate delay between requests for ramp-up
         if ramp_up_seconds > 0:
-            delay_between_requests = ramp_up_seconds / num_requests
+            delay_between_requests = ramp_up_seconds / len(work)
         else:
             delay_between_requests = 0
         
+        # One keep-alive connection per simulated user instead of a new
+        # TCP connection for every request
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=concurrent_users))
+        
         with ThreadPoolExecutor(max_workers=concurrent_users) as executor:
             futures = []
             
-            for i in range(num_requests):
+            # Bind the producer loop's lookups once rather than per request
+            submit = executor.submit
+            add_future = futures.append
+            sleep = time.sleep
+            monotonic = time.monotonic
+            
+            # Schedule against fixed deadlines so sleep overshoot and submit
+            # overhead don't accumulate into a slower ramp-up
+            schedule_start = monotonic()
+            
+            for i, item in enumerate(work):
                 if delay_between_requests > 0:
-                    time.sleep(delay_between_requests)
+                    remaining = schedule_start + i * delay_between_requests - monotonic()
+                    if remaining > 0:
+                        sleep(remaining)
                 
-                future = executor.submit(self.submit_charging_request, i + 1)
-                futures.append(future)
+                add_future(submit(submit_request, item))
             
             # Wait for all requests to complete
             for future in as_completed(futures):
@@ -140,7 +228,7 @@ class LoadTester:
         """Get current system status"""
         try:
             # Get charge request service status
-            response = requests.get(f"{self.base_url}/status", timeout=5)
+            response = self.session.get(f"{self.base_url}/status", timeout=5)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -150,44 +238,38 @@ class LoadTester:
     
     def analyze_results(self):
         """Analyze the test results"""
-        if not self.results:
+        results = list(self.results)
+        if not results:
             return "No results to analyze"
         
-        successful_requests = [r for r in self.results if r['success']]
-        failed_requests = [r for r in self.results if not r['success']]
+        successful_requests = [r for r in results if r['success']]
+        failed_requests = [r for r in results if not r['success']]
         
-        response_times = [r['response_time'] for r in successful_requests]
+        response_times = np.fromiter((r['response_time'] for r in successful_requests), dtype=np.float64)
+        has_times = response_times.size > 0
+        
+        # Analyze substation and power distribution
+        substation_ids, substation_counts = np.unique(
+            [str(r.get('substation_id', 'unknown')) for r in successful_requests], return_counts=True)
+        powers, power_counts = np.unique(
+            [r.get('requested_kw', 0) for r in successful_requests], return_counts=True)
         
         analysis = {
-            'total_requests': len(self.results),
+            'total_requests': len(results),
             'successful_requests': len(successful_requests),
             'failed_requests': len(failed_requests),
-            'success_rate': len(successful_requests) / len(self.results) * 100,
+            'success_rate': len(successful_requests) / len(results) * 100,
             'response_time_stats': {
-                'mean': statistics.mean(response_times) if response_times else 0,
-                'median': statistics.median(response_times) if response_times else 0,
-                'min': min(response_times) if response_times else 0,
-                'max': max(response_times) if response_times else 0,
-                'std_dev': statistics.stdev(response_times) if len(response_times) > 1 else 0
+                'mean': float(response_times.mean()) if has_times else 0,
+                'median': float(np.median(response_times)) if has_times else 0,
+                'min': float(response_times.min()) if has_times else 0,
+                'max': float(response_times.max()) if has_times else 0,
+                'std_dev': float(response_times.std(ddof=1)) if response_times.size > 1 else 0
             },
-            'substation_distribution': {},
-            'power_distribution': {}
+            'substation_distribution': dict(zip(substation_ids.tolist(), substation_counts.tolist())),
+            'power_distribution': dict(zip(powers.tolist(), power_counts.tolist()))
         }
         
-        # Analyze substation distribution
-        substation_counts = {}
-        power_usage = {}
-        
-        for result in successful_requests:
-            substation_id = result.get('substation_id', 'unknown')
-            substation_counts[substation_id] = substation_counts.get(substation_id, 0) + 1
-            
-            requested_kw = result.get('requested_kw', 0)
-            power_usage[requested_kw] = power_usage.get(requested_kw, 0) + 1
-        
-        analysis['substation_distribution'] = substation_counts
-        analysis['power_distribution'] = power_usage
-        
         return analysis
     
     def print_results(self):
@@ -239,12 +321,17 @@ class LoadTester:
                 'base_url': self.base_url,
                 'total_requests': len(self.results)
             },
-            'results': self.results,
+            'results': list(self.results),
             'analysis': self.analyze_results()
         }
         
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
+        if orjson is not None:
+            options = orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            with open(filename, 'wb') as f:
+                f.write(orjson.dumps(data, option=options))
+        else:
+            with open(filename, 'w') as f:
+                json.dump(data, f, indent=2)
         
         logger.info(f"Results saved to {filename}")
 
@@ -254,6 +341,7 @@ def main():
     parser.add_argument('--requests', type=int, default=100, help='Number of requests to send')
     parser.add_argument('--concurrent', type=int, default=10, help='Number of concurrent users')
     parser.add_argument('--ramp-up', type=int, default=60, help='Ramp-up time in seconds')
+    parser.add_argument('--batch-size', type=int, default=1, help='Requests sent per POST to /charge/batch (1 sends individual requests)')
     parser.add_argument('--save', help='Save results to specified file')
     
     args = parser.parse_args()
@@ -268,7 +356,7 @@ def main():
     
     # Run the load test
     try:
-        total_duration = tester.run_load_test(args.requests, args.concurrent, args.ramp_up)
+        total_duration = tester.run_load_test(args.requests, args.concurrent, args.ramp_up, args.batch_size)
         
         # Print results
         tester.print_results()
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Gunicorn configuration for the Substation Service
+Charging sessions and load live in process memory, so the service runs as a
+single worker and scales request handling with threads
+"""
+
+import os
+
+bind = '0.0.0.0:5000'
+workers = 1
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+
+def post_worker_init(worker):
+    """Create the substation inside the serving worker"""
+    from main import init_substation
+    init_substation()
@@ -5,24 +5,58 @@ Simulates a charging substation and exposes load metrics via Prometheus
 """
 
 import time
+import os
 import random
 import threading
-from flask import Flask, jsonify
-from prometheus_client import generate_latest, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST
+import itertools
+import zlib
+import gzip
+from flask import Flask, request
+from prometheus_client import generate_latest, Histogram, REGISTRY, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
 import logging
+import orjson
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.config['PROPAGATE_EXCEPTIONS'] = False
+
+def jsonify(obj):
+    """Serialize a response body with orjson instead of the stdlib encoder"""
+    return app.response_class(orjson.dumps(obj), mimetype='application/json')
 
 # Prometheus metrics
-charging_requests_total = Counter('charging_requests_total', 'Total number of charging requests')
 charging_duration_seconds = Histogram('charging_duration_seconds', 'Time spent charging')
-current_load = Gauge('current_load', 'Current load percentage of the substation')
-active_chargers = Gauge('active_chargers', 'Number of active chargers')
-total_capacity = Gauge('total_capacity', 'Total charging capacity in kW')
+
+class SubstationCollector(Collector):
+    """Reads the substation's plain counters at collection time"""
+    
+    def __init__(self, state):
+        self.state = state
+    
+    def collect(self):
+        state = self.state
+        yield CounterMetricFamily('charging_requests_total', 'Total number of charging requests',
+                                  value=state.sessions_started)
+        yield GaugeMetricFamily('current_load', 'Current load percentage of the substation',
+                                value=state.current_load)
+        yield GaugeMetricFamily('active_chargers', 'Number of active chargers',
+                                value=state.active_chargers)
+        yield GaugeMetricFamily('total_capacity', 'Total charging capacity in kW',
+                                value=state.max_capacity)
+
+class ChargingSession:
+    """A single active charging session"""
+    __slots__ = ('ev_id', 'requested_kw', 'start_ns')
+    
+    def __init__(self, ev_id, requested_kw, start_ns):
+        self.ev_id = ev_id
+        self.requested_kw = requested_kw
+        self.start_ns = start_ns
 
 # Substation state
 class SubstationState:
@@ -31,73 +65,146 @@ class SubstationState:
         self.max_capacity = max_capacity
         self.current_load = 0
         self.active_chargers = 0
-        self.charging_sessions = {}
+        self.charging_sessions = {}  # sid -> ChargingSession
+        self._next_sid = itertools.count(1)
+        self.sessions_started = 0
         self.lock = threading.Lock()
         
-        # Initialize metrics
-        total_capacity.set(max_capacity)
-        current_load.set(0)
-        active_chargers.set(0)
+        # /status is served from a snapshot republished on every transition
+        self._pct_scale = 100.0 / max_capacity
+        self._publish_status()
+        
+        # The exposition is rendered by a background thread; the counters
+        # themselves are read by SubstationCollector at render time
+        self.metrics_flush_interval = 1  # seconds
+        self.metrics_snapshot = (b'', b'', '0')
+    
+    def start_metrics_flush(self):
+        """Render the first metrics snapshot and keep refreshing it"""
+        self.flush_metrics()
+        threading.Thread(target=self._flush_metrics_loop, daemon=True).start()
+    
+    def _flush_metrics_loop(self):
+        while True:
+            time.sleep(self.metrics_flush_interval)
+            self.flush_metrics()
+    
+    def flush_metrics(self):
+        """Pre-render (and pre-compress) the exposition so scrapes just return bytes"""
+        payload = generate_latest()
+        self.metrics_snapshot = (payload, gzip.compress(payload, compresslevel=1), f'{zlib.crc32(payload):08x}')
     
     def start_charging(self, ev_id, requested_kw):
+        # Optimistic lock-free rejection; requests that look like they fit are
+        # re-checked under the lock before capacity is reserved
+        if self.current_load + requested_kw > self.max_capacity:
+            logger.warning("Cannot start charging for EV %s: insufficient capacity", ev_id)
+            return None
+        
+        # Build the session outside the lock; only the reservation is serialized
+        sid = next(self._next_sid)
+        session = ChargingSession(ev_id, requested_kw, time.monotonic_ns())
+        
         with self.lock:
-            if self.current_load + requested_kw <= self.max_capacity:
-                session_id = f"{self.substation_id}_{ev_id}_{int(time.time())}"
-                self.charging_sessions[session_id] = {
-                    'ev_id': ev_id,
-                    'requested_kw': requested_kw,
-                    'start_time': time.time(),
-                    'status': 'charging'
-                }
+            if self.current_load + requested_kw > self.max_capacity:
+                sid = None
+            else:
+                self.charging_sessions[sid] = session
                 self.current_load += requested_kw
                 self.active_chargers += 1
-                
-                # Update metrics
-                current_load.set(self.current_load)
-                active_chargers.set(self.active_chargers)
-                charging_requests_total.inc()
-                
-                logger.info(f"Started charging session {session_id} for EV {ev_id} with {requested_kw}kW")
-                return session_id
-            else:
-                logger.warning(f"Cannot start charging for EV {ev_id}: insufficient capacity")
-                return None
+                self.sessions_started += 1
+                self._publish_status()
+        
+        if sid is None:
+            logger.warning("Cannot start charging for EV %s: insufficient capacity", ev_id)
+            return None
+        
+        session_id = f"{self.substation_id}-{sid:x}"
+        logger.info("Started charging session %s for EV %s with %skW", session_id, ev_id, requested_kw)
+        return session_id
+    
+    def parse_session_id(self, session_id):
+        """Map an external '<substation_id>-<hex sid>' id to its integer key"""
+        prefix, _, sid = session_id.rpartition('-')
+        if prefix != str(self.substation_id):
+            return None
+        try:
+            return int(sid, 16)
+        except ValueError:
+            return None
     
     def stop_charging(self, session_id):
+        sid = self.parse_session_id(session_id)
+        
         with self.lock:
-            if session_id in self.charging_sessions:
-                session = self.charging_sessions[session_id]
-                duration = time.time() - session['start_time']
-                
-                self.current_load -= session['requested_kw']
-                self.active_chargers -= 1
-                
-                # Update metrics
-                current_load.set(self.current_load)
-                active_chargers.set(self.active_chargers)
-                charging_duration_seconds.observe(duration)
-                
-                del self.charging_sessions[session_id]
-                logger.info(f"Stopped charging session {session_id} after {duration:.2f} seconds")
-                return True
-            return False
+            session = self.charging_sessions.pop(sid, None)
+            if session is None:
+                return False
+            
+            self.current_load -= session.requested_kw
+            self.active_chargers -= 1
+            self._publish_status()
+        
+        duration = (time.monotonic_ns() - session.start_ns) / 1e9
+        
+        charging_duration_seconds.observe(duration)
+        
+        logger.info("Stopped charging session %s after %.2f seconds", session_id, duration)
+        return True
+    
+    def _publish_status(self):
+        """Rebuild the status snapshot (caller holds self.lock)"""
+        status = {
+            'substation_id': self.substation_id,
+            'current_load': self.current_load,
+            'max_capacity': self.max_capacity,
+            'load_percentage': self.current_load * self._pct_scale,
+            'active_chargers': self.active_chargers,
+            'available_capacity': self.max_capacity - self.current_load
+        }
+        # Each reference is replaced whole, so lock-free readers always see a
+        # complete snapshot
+        self._status = status
+        self.status_bytes = orjson.dumps(status)
     
     def get_status(self):
-        with self.lock:
-            return {
-                'substation_id': self.substation_id,
-                'current_load': self.current_load,
-                'max_capacity': self.max_capacity,
-                'load_percentage': (self.current_load / self.max_capacity) * 100,
-                'active_chargers': self.active_chargers,
-                'available_capacity': self.max_capacity - self.current_load
-            }
-
-# Initialize substation
-substation = SubstationState(
-    substation_id=random.randint(1000, 9999),
-    max_capacity=random.randint(80, 120)
-)
+        return self._status
+
+# Substation state is created per serving process by init_substation()
+substation = None
+ROOT_BODY = None
+
+def init_substation():
+    """Create this process's substation with a freshly seeded random id and capacity"""
+    global substation, ROOT_BODY
+    if substation is not None:
+        return substation
+    
+    rng = random.Random(os.urandom(16))
+    substation = SubstationState(
+        substation_id=rng.randint(1000, 9999),
+        max_capacity=rng.randint(80, 120)
+    )
+    REGISTRY.register(SubstationCollector(substation))
+    substation.start_metrics_flush()
+    
+    # The root payload is fixed for the life of the process, so serialize it once
+    ROOT_BODY = orjson.dumps({
+        'service': 'substation_service',
+        'substation_id': substation.substation_id,
+        'endpoints': {
+            'health': '/health',
+            'status': '/status',
+            'load': '/load',
+            'metrics': '/metrics',
+            'charge': '/charge (POST)',
+            'stop_charge': '/charge/<session_id> (DELETE)'
+        }
+    })
+    
+    logger.info(f"Starting Substation Service with ID: {substation.substation_id}")
+    logger.info(f"Max capacity: {substation.max_capacity}kW")
+    return substation
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -111,13 +218,21 @@ def health_check():
 @app.route('/status', methods=['GET'])
 def get_status():
     """Get current substation status"""
-    return jsonify(substation.get_status())
+    return app.response_class(substation.status_bytes, mimetype='application/json')
+
+@app.route('/load', methods=['GET'])
+def get_load():
+    """Compact load reading polled by the load balancer"""
+    return jsonify({
+        'current_load': substation.current_load,
+        'total_capacity': substation.max_capacity
+    })
 
 @app.route('/charge', methods=['POST'])
 def start_charging():
     """Start a charging session"""
     try:
-        data = request.get_json()
+        data = orjson.loads(request.get_data())
         ev_id = data.get('ev_id')
         requested_kw = data.get('requested_kw', 10)
         
@@ -155,28 +270,26 @@ def stop_charging(session_id):
 @app.route('/metrics', methods=['GET'])
 def metrics():
     """Prometheus metrics endpoint"""
-    return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+    payload, payload_gz, version = substation.metrics_snapshot
+    headers = {'Content-Type': CONTENT_TYPE_LATEST, 'Vary': 'Accept-Encoding'}
+    
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        payload = payload_gz
+        headers['Content-Encoding'] = 'gzip'
+        headers['ETag'] = f'"{version}-gz"'
+    else:
+        headers['ETag'] = f'"{version}"'
+    
+    if request.headers.get('If-None-Match') == headers['ETag']:
+        return '', 304, {'ETag': headers['ETag'], 'Vary': 'Accept-Encoding'}
+    return payload, 200, headers
 
 @app.route('/', methods=['GET'])
 def root():
     """Root endpoint with basic info"""
-    return jsonify({
-        'service': 'substation_service',
-        'substation_id': substation.substation_id,
-        'endpoints': {
-            'health': '/health',
-            'status': '/status',
-            'metrics': '/metrics',
-            'charge': '/charge (POST)',
-            'stop_charge': '/charge/<session_id> (DELETE)'
-        }
-    })
+    return app.response_class(ROOT_BODY, mimetype='application/json', direct_passthrough=True)
 
 if __name__ == '__main__':
-    # Add missing import
-    from flask import request
-    
-    logger.info(f"Starting Substation Service with ID: {substation.substation_id}")
-    logger.info(f"Max capacity: {substation.max_capacity}kW")
+    init_substation()
     
-    app.run(host='0.0.0.0', port=5000, debug=False) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False, use_debugger=False) 
\ No newline at end of file
@@ -5,11 +5,20 @@ Tests all components to ensure the system is working correctly
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import json
 import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 class SystemVerifier:
     def __init__(self):
         self.base_urls = {
@@ -22,6 +31,11 @@ class SystemVerifier:
             'grafana': 'http://localhost:3000'
         }
         self.results = []
+        self.lock = threading.Lock()
+        
+        # Reuse keep-alive connections across every probe
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=16, pool_maxsize=32))
         
     def log_result(self, test_name, success, message, details=None):
         """Log test result"""
@@ -32,18 +46,20 @@ class SystemVerifier:
             'timestamp': datetime.now().isoformat(),
             'details': details
         }
-        self.results.append(result)
-        
         status = "✅ PASS" if success else "❌ FAIL"
-        print(f"{status} {test_name}: {message}")
         
-        if details:
-            print(f"   Details: {details}")
+        # Probes may log from worker threads; keep each entry's lines together
+        with self.lock:
+            self.results.append(result)
+            print(f"{status} {test_name}: {message}")
+            
+            if details:
+                print(f"   Details: {details}")
     
     def test_service_health(self, service_name, url):
         """Test if a service is healthy"""
         try:
-            response = requests.get(f"{url}/health", timeout=5)
+            response = self.session.get(f"{url}/health", timeout=5)
             if response.status_code == 200:
                 data = response.json()
                 self.log_result(f"{service_name} Health Check", True, "Service is healthy", data)
@@ -58,7 +74,7 @@ class SystemVerifier:
     def test_metrics_endpoint(self, service_name, url):
         """Test if metrics endpoint is accessible"""
         try:
-            response = requests.get(f"{url}/metrics", timeout=5)
+            response = self.session.get(f"{url}/metrics", timeout=5)
             if response.status_code == 200:
                 self.log_result(f"{service_name} Metrics", True, "Metrics endpoint accessible")
                 return True
@@ -73,7 +89,7 @@ class SystemVerifier:
         """Test substation registration with load balancer"""
         try:
             # Get current substations
-            response = requests.get(f"{self.base_urls['load_balancer']}/substations", timeout=5)
+            response = self.session.get(f"{self.base_urls['load_balancer']}/substations", timeout=5)
             if response.status_code == 200:
                 data = response.json()
                 substation_count = len(data.get('substations', []))
@@ -86,6 +102,24 @@ class SystemVerifier:
             self.log_result("Substation Registration", False, f"Connection failed: {str(e)}")
             return False
     
+    def wait_for_charging(self, substation_id, timeout=2.0):
+        """Poll substation status until the given substation has an active charger"""
+        substation_urls = [url for service_name, url in self.base_urls.items()
+                           if service_name.startswith('substation_')]
+        deadline = time.monotonic() + timeout
+        
+        while time.monotonic() < deadline:
+            for url in substation_urls:
+                try:
+                    status = self.session.get(f"{url}/status", timeout=1).json()
+                except Exception:
+                    continue
+                if status.get('substation_id') == substation_id and status.get('active_chargers', 0) > 0:
+                    return True
+            time.sleep(0.02)
+        
+        return False
+    
     def test_charging_request(self):
         """Test a complete charging request flow"""
         try:
@@ -96,7 +130,7 @@ class SystemVerifier:
                 'duration_minutes': 60
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_urls['charge_request']}/charge",
                 json=request_data,
                 timeout=10
@@ -110,10 +144,10 @@ class SystemVerifier:
                 self.log_result("Charging Request", True, 
                                f"Request successful - Session: {session_id}, Substation: {substation_id}")
                 
-                # Test stopping the session
-                time.sleep(2)  # Let it charge for a bit
+                # Test stopping the session once the substation reports it charging
+                self.wait_for_charging(substation_id)
                 
-                stop_response = requests.delete(
+                stop_response = self.session.delete(
                     f"{self.base_urls['charge_request']}/sessions/{session_id}",
                     timeout=5
                 )
@@ -132,42 +166,38 @@ class SystemVerifier:
             self.log_result("Charging Request", False, f"Request failed: {str(e)}")
             return False
     
+    def send_probe_request(self, index):
+        """Send one load-balancing probe request"""
+        request_data = {
+            'ev_id': f'TEST_EV_{index:03d}',
+            'requested_kw': 11,
+            'duration_minutes': 30
+        }
+        
+        return self.session.post(
+            f"{self.base_urls['charge_request']}/charge",
+            json=request_data,
+            timeout=5
+        )
+    
     def test_load_balancing(self):
         """Test load balancing by sending multiple requests"""
         try:
-            requests_sent = 0
-            successful_requests = 0
-            substation_distribution = {}
+            # Send 10 test requests concurrently
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                responses = list(executor.map(self.send_probe_request, range(10)))
             
-            # Send 10 test requests
-            for i in range(10):
-                request_data = {
-                    'ev_id': f'TEST_EV_{i:03d}',
-                    'requested_kw': 11,
-                    'duration_minutes': 30
-                }
-                
-                response = requests.post(
-                    f"{self.base_urls['charge_request']}/charge",
-                    json=request_data,
-                    timeout=5
-                )
-                
-                requests_sent += 1
-                
-                if response.status_code == 200:
-                    successful_requests += 1
-                    result = response.json()
-                    substation_id = result.get('substation_id')
-                    substation_distribution[substation_id] = substation_distribution.get(substation_id, 0) + 1
-                
-                time.sleep(0.5)  # Small delay between requests
+            requests_sent = len(responses)
+            substation_distribution = Counter(
+                response.json().get('substation_id') for response in responses if response.status_code == 200
+            )
+            successful_requests = sum(substation_distribution.values())
             
             success_rate = (successful_requests / requests_sent) * 100
             
             self.log_result("Load Balancing", True, 
                            f"Success rate: {success_rate:.1f}% ({successful_requests}/{requests_sent})",
-                           f"Distribution: {substation_distribution}")
+                           f"Distribution: {dict(substation_distribution)}")
             
             return success_rate >= 80  # At least 80% success rate
             
@@ -179,14 +209,14 @@ class SystemVerifier:
         """Test monitoring stack accessibility"""
         try:
             # Test Prometheus
-            response = requests.get(f"{self.base_urls['prometheus']}/-/healthy", timeout=5)
+            response = self.session.get(f"{self.base_urls['prometheus']}/-/healthy", timeout=5)
             if response.status_code == 200:
                 self.log_result("Prometheus Health", True, "Prometheus is healthy")
             else:
                 self.log_result("Prometheus Health", False, f"HTTP {response.status_code}")
             
             # Test Grafana
-            response = requests.get(f"{self.base_urls['grafana']}/api/health", timeout=5)
+            response = self.session.get(f"{self.base_urls['grafana']}/api/health", timeout=5)
             if response.status_code == 200:
                 self.log_result("Grafana Health", True, "Grafana is healthy")
             else:
@@ -200,17 +230,17 @@ class SystemVerifier:
         print("🔍 Smart Grid Load Balancer - System Verification")
         print("=" * 60)
         
-        # Test service health
-        print("\n📊 Testing Service Health...")
-        for service_name, url in self.base_urls.items():
-            if service_name not in ['prometheus', 'grafana']:
-                self.test_service_health(service_name, url)
+        # Test service health and metrics endpoints concurrently
+        print("\n📊 Testing Service Health and Metrics Endpoints...")
+        services = [(service_name, url) for service_name, url in self.base_urls.items()
+                    if service_name not in ['prometheus', 'grafana']]
+        probes = [self.test_service_health, self.test_metrics_endpoint]
         
-        # Test metrics endpoints
-        print("\n📈 Testing Metrics Endpoints...")
-        for service_name, url in self.base_urls.items():
-            if service_name not in ['prometheus', 'grafana']:
-                self.test_metrics_endpoint(service_name, url)
+        with ThreadPoolExecutor(max_workers=len(services) * len(probes)) as executor:
+            futures = [executor.submit(probe, service_name, url)
+                       for probe in probes for service_name, url in services]
+            for future in futures:
+                future.result()
         
         # Test substation registration
         print("\n🔗 Testing Substation Registration...")
@@ -254,8 +284,12 @@ class SystemVerifier:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"system_verification_{timestamp}.json"
         
-        with open(filename, 'w') as f:
-            json.dump(self.results, f, indent=2)
+        if orjson is not None:
+            with open(filename, 'wb') as f:
+                f.write(orjson.dumps(self.results, option=orjson.OPT_INDENT_2))
+        else:
+            with open(filename, 'w') as f:
+                json.dump(self.results, f, indent=2)
         
         print(f"\n📄 Results saved to {filename}")
 